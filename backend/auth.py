@@ -1,37 +1,78 @@
 """
 Authentication Utilities
 
-This module handles JWT token creation/validation, password hashing,
-and authentication middleware for protected routes.
+This module handles JWT token creation/validation, opaque Redis-backed
+session tokens, password hashing, and authentication middleware for
+protected routes.
 """
 
+import asyncio
 import os
-from datetime import datetime, timedelta
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+import bcrypt
+from cachetools import TTLCache
+import jwt
+from jwt import InvalidTokenError
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from database import get_users_collection
+from redis.exceptions import RedisError
+from database import get_users_collection, get_redis
 from schemas import TokenData, UserInDB
-from bson import ObjectId
+from utils import to_object_id, utc_now
 
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Kind of access token handed out at signup/login:
+# - "jwt":   stateless HS256-signed tokens (default)
+# - "redis": opaque random session ids resolved with a single Redis GET,
+#            no signature verification per request (requires REDIS_URL)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "jwt")
+SESSION_KEY_PREFIX = "sess:"
+
+# Password hashing cost factor (2^12 bcrypt rounds)
+BCRYPT_ROUNDS = 12
+
+# bcrypt only looks at the first 72 bytes of a password
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+# bcrypt at cost 12 burns ~250ms of CPU per call; running it on the event
+# loop would stall every other in-flight request, so it goes to a thread pool.
+# bcrypt releases the GIL while hashing, so threads give real parallelism
+# without the pickling overhead and extra processes of a process pool.
+_bcrypt_pool = ThreadPoolExecutor(
+    max_workers=os.cpu_count(), thread_name_prefix="bcrypt"
+)
 
 # HTTP Bearer token scheme
 security = HTTPBearer()
 
+# Decoded JWT payloads keyed by the raw token string. The same bearer token is
+# presented on every request of a session, so a hit skips the HMAC-SHA256
+# verification and JSON parse. Entries never outlive the token's own "exp".
+# Sized for one entry per concurrently active session.
+TOKEN_CACHE_TTL_SECONDS = 60
+_token_cache: TTLCache = TTLCache(maxsize=50000, ttl=TOKEN_CACHE_TTL_SECONDS)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+# Resolved users keyed by user id, so steady-state authenticated requests do
+# not need a Mongo round-trip. Sized like the token cache (one entry per
+# active session). Call invalidate_user() after mutating a user.
+USER_CACHE_TTL_SECONDS = 60
+_user_cache: TTLCache = TTLCache(maxsize=50000, ttl=USER_CACHE_TTL_SECONDS)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify a plain password against a hashed password
     
+    The bcrypt check runs in a worker thread so the event loop stays free.
+    
     Args:
         plain_password: The plain text password
         hashed_password: The hashed password to verify against
@@ -39,21 +80,36 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     Returns:
         True if password matches, False otherwise
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _bcrypt_pool,
+        bcrypt.checkpw,
+        plain_password.encode()[:BCRYPT_MAX_PASSWORD_BYTES],
+        hashed_password.encode()
+    )
 
 
-def get_password_hash(password: str) -> str:
+async def get_password_hash(password: str) -> str:
     """
     Generate a hash from a plain password
     
+    The bcrypt hashing runs in a worker thread so the event loop stays free.
+    
     Args:
         password: Plain text password to hash
     
     Returns:
         Hashed password string
     """
-    return pwd_context.hash(password) #hash function is imported from bcrypt and then runs and 
-    #passes it through a cryptographic algorithm 
+    loop = asyncio.get_running_loop()
+    hashed = await loop.run_in_executor( #hash function is imported from bcrypt and then runs and 
+        #passes it through a cryptographic algorithm 
+        _bcrypt_pool,
+        bcrypt.hashpw,
+        password.encode()[:BCRYPT_MAX_PASSWORD_BYTES],
+        bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    )
+    return hashed.decode()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -69,15 +125,111 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     """
     to_encode = data.copy() # we store the users id , role in this payload
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta # this is basically current timestamp + delta 
+        expire = utc_now() + expires_delta # this is basically current timestamp + delta 
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = utc_now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode.update({"exp": expire}) # now we have the data encoded again with the expiry in it 
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt # this is the new jw token 
 
 
+async def create_session_token(user_id: str, expires_delta: timedelta) -> str:
+    """
+    Create an opaque session token stored in Redis
+    
+    Args:
+        user_id: Id of the user the session belongs to
+        expires_delta: Session lifetime
+    
+    Returns:
+        Random URL-safe session token
+    
+    Raises:
+        RedisError: If the session could not be stored
+    """
+    token = secrets.token_urlsafe(32)
+    await get_redis().setex(f"{SESSION_KEY_PREFIX}{token}", expires_delta, user_id)
+    return token
+
+
+async def issue_access_token(user_id: str, expires_delta: timedelta) -> str:
+    """
+    Issue an access token for a user using the configured SESSION_BACKEND
+    
+    Falls back to a JWT when Redis sessions are configured but Redis is
+    unavailable, so logins keep working.
+    
+    Args:
+        user_id: Id of the authenticated user
+        expires_delta: Token lifetime
+    
+    Returns:
+        Access token string (JWT or opaque session id)
+    """
+    if SESSION_BACKEND == "redis" and get_redis() is not None:
+        try:
+            return await create_session_token(user_id, expires_delta)
+        except RedisError:
+            pass
+    
+    return create_access_token(data={"sub": user_id}, expires_delta=expires_delta)
+
+
+async def get_session_user_id(token: str) -> Optional[str]:
+    """
+    Resolve an opaque session token to its user id
+    
+    Args:
+        token: Opaque session token
+    
+    Returns:
+        User id if the session exists and has not expired, None otherwise
+    """
+    redis = get_redis()
+    if redis is None:
+        return None
+    
+    try:
+        user_id = await redis.get(f"{SESSION_KEY_PREFIX}{token}")
+    except RedisError:
+        return None
+    
+    return user_id.decode() if user_id else None
+
+
+def decode_access_token(token: str) -> dict:
+    """
+    Decode and verify a JWT access token, reusing cached payloads
+    
+    Args:
+        token: Encoded JWT token string
+    
+    Returns:
+        Decoded token payload
+    
+    Raises:
+        InvalidTokenError: If the token signature is invalid or the token has expired
+    """
+    payload = _token_cache.get(token)
+    if payload is not None:
+        return payload
+    
+    # PyJWT compares the HMAC with hmac.compare_digest, so verification time
+    # does not leak how many signature bytes matched.
+    # This deliberately runs on the event loop: an HS256 check is a single
+    # HMAC over a few hundred bytes (~20µs), several times cheaper than
+    # handing it to a worker thread and back (~100µs via run_in_threadpool).
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    
+    # Only cache tokens that will stay valid for the whole cache TTL window;
+    # tokens about to expire are simply decoded again on the next request
+    if payload.get("exp", 0) - time.time() > TOKEN_CACHE_TTL_SECONDS:
+        _token_cache[token] = payload
+    
+    return payload
+
+
 async def get_user_by_email(email: str) -> Optional[UserInDB]:
     """
     Retrieve user from database by email
@@ -92,7 +244,8 @@ async def get_user_by_email(email: str) -> Optional[UserInDB]:
     user_data = await users_collection.find_one({"email": email})
     
     if user_data:
-        return UserInDB(**user_data)
+        # Stored user documents are trusted, skip re-validation
+        return UserInDB.model_construct(**user_data)
     return None
 
 
@@ -106,18 +259,37 @@ async def get_user_by_id(user_id: str) -> Optional[UserInDB]:
     Returns:
         UserInDB object if found, None otherwise
     """
+    user = _user_cache.get(user_id)
+    if user is not None:
+        return user
+    
     users_collection = get_users_collection()
     
     try:
-        user_data = await users_collection.find_one({"_id": ObjectId(user_id)})
+        user_data = await users_collection.find_one({"_id": to_object_id(user_id)})
         if user_data:
-            return UserInDB(**user_data)
+            user = UserInDB.model_construct(**user_data)
+            _user_cache[user_id] = user
+            return user
     except Exception:
         pass
     
     return None
 
 
+def invalidate_user(user_id: str) -> None:
+    """
+    Drop a user from the in-process user cache
+    
+    Must be called by any operation that mutates a user document so the
+    next authenticated request sees the fresh data.
+    
+    Args:
+        user_id: User ObjectId as string
+    """
+    _user_cache.pop(user_id, None)
+
+
 async def authenticate_user(email: str, password: str) -> Optional[UserInDB]:
     """
     Authenticate user credentials
@@ -132,7 +304,7 @@ async def authenticate_user(email: str, password: str) -> Optional[UserInDB]:
     user = await get_user_by_email(email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return None
     return user
 
@@ -140,63 +312,67 @@ async def authenticate_user(email: str, password: str) -> Optional[UserInDB]:
 #authenticating
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserInDB:
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> UserInDB:
     """
-    Get current authenticated user from JWT token
+    Get current authenticated and active user from JWT token
     
     This dependency can be used in route handlers to ensure authentication
-    and get the current user information.
+    and get the current user information. It also rejects disabled accounts,
+    so routes only need this single dependency.
+    
+    The resolved user is stored on `request.state.user`, so anything else
+    running within the same request (further dependencies, handlers that
+    call this directly) reuses it instead of resolving the token again.
     
     Args:
+        request: Current request (holds the per-request user)
         credentials: HTTP Bearer credentials from request header
     
     Returns:
-        UserInDB object for the authenticated user
+        UserInDB object for the authenticated active user
     
     Raises:
-        HTTPException: If token is invalid or user not found
+        HTTPException: If token is invalid, user not found or account disabled
     """
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return user
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
+    token = credentials.credentials
+    
+    if "." in token:
+        # JWT (header.payload.signature)
+        try:
+            payload = decode_access_token(token)
+        except InvalidTokenError:
             raise credentials_exception
-        token_data = TokenData(user_id=user_id)
-    except JWTError:
+        user_id: Optional[str] = payload.get("sub")
+    else:
+        # Opaque session id; URL-safe session tokens never contain a "."
+        user_id = await get_session_user_id(token)
+    
+    if user_id is None:
         raise credentials_exception
+    token_data = TokenData(user_id=user_id)
     
     user = await get_user_by_id(token_data.user_id)
     if user is None:
         raise credentials_exception
     
-    return user
-
-
-async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
-    """
-    Get current authenticated and active user
-    
-    This dependency ensures the user is both authenticated and active.
-    
-    Args:
-        current_user: Current user from get_current_user dependency
-    
-    Returns:
-        UserInDB object for the authenticated active user
-    
-    Raises:
-        HTTPException: If user account is disabled
-    """
-    if not current_user.is_active:
+    if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Inactive user account"
         )
-    return current_user
+    
+    request.state.user = user
+    return user
@@ -6,19 +6,176 @@ This module contains all database CRUD operations including:
 - Note creation, reading, updating, and deletion
 - Optimistic concurrency control using version numbers (prevents overwriting changes from another session)
 - Atomic operations (ensuring MongoDB executes updates/deletes safely in a single step)
+- Query-result caching of note listings/counts in Redis (when configured)
 """
 
-from datetime import datetime
-from typing import List, Optional
+import os
+import re
+from typing import AsyncIterator, Dict, List, Literal, Optional, Union
 from bson import ObjectId
+from bson.regex import Regex
+from cachetools import TTLCache
+from pydantic import TypeAdapter
+from pymongo import ReturnDocument
 from pymongo.errors import DuplicateKeyError
+from redis.exceptions import RedisError
 from fastapi import HTTPException, status
-from database import get_users_collection, get_notes_collection
+from database import get_users_collection, get_notes_collection, get_redis, LIVE_NOTES_INDEX_NAME
 from schemas import (
     UserSignUp, UserInDB, NoteCreate, NoteUpdate, 
-    NoteInDB, NoteResponse
+    NoteInDB, NoteResponse, NoteListItem, NoteSummaryResponse
 )
 from auth import get_password_hash
+from utils import singleflight, singleflight_forget, utc_now
+
+
+# =====================================================
+# QUERY RESULT CACHE
+# =====================================================
+# Listing and counting notes hit MongoDB with identical parameters on every
+# dashboard load. When Redis is configured, those results are cached per user.
+#
+# Instead of hunting down every cached page on a write, each user has a
+# version counter that is part of every cache key. Writes bump the counter,
+# which orphans all older entries at once; they then simply expire.
+
+NOTES_CACHE_TTL_SECONDS = 30
+
+_notes_list_adapters = {
+    NoteListItem: TypeAdapter(List[NoteListItem]),
+    NoteSummaryResponse: TypeAdapter(List[NoteSummaryResponse]),
+}
+
+# Per-user note counts only change on create/delete, yet every page load asks
+# for them. A short-lived in-process cache in front of Redis/MongoDB answers
+# repeated page requests without any round trip at all. It is local to this
+# worker, so by default the TTL is kept short to bound staleness after writes
+# handled by other workers. Single-worker deployments, where every write
+# clears this cache directly, can safely raise it (e.g. to 30).
+NOTES_COUNT_LOCAL_TTL_SECONDS = int(os.getenv("NOTES_COUNT_CACHE_TTL", "5"))
+_notes_count_cache = TTLCache(maxsize=10000, ttl=NOTES_COUNT_LOCAL_TTL_SECONDS)
+
+# The first page of a user's notes is by far the most requested list (every
+# dashboard load, refresh and polling tick). Its fully serialized response
+# body is kept per user for a few seconds, keyed by the remaining list
+# parameters, so bursts of identical reads skip the query and serialization.
+#
+# A write only clears this cache in the worker that handled it. So with Redis
+# configured, the key also holds the user's Redis cache version, which every
+# write bumps for all workers; without Redis, the cache is only used when the
+# app runs as a single worker (WEB_CONCURRENCY, as read by main.py and the
+# uvicorn/gunicorn CLIs).
+NOTES_PAGE_CACHE_TTL_SECONDS = 5
+_first_page_cache = TTLCache(maxsize=10000, ttl=NOTES_PAGE_CACHE_TTL_SECONDS)
+SINGLE_WORKER = int(os.getenv("WEB_CONCURRENCY", "1")) <= 1
+
+# Per-user write generation, bumped by every write to the user's notes. A read
+# that started before a write can finish after it (and after the write cleared
+# the caches above); it then must not store its now stale result. Readers take
+# the generation before querying and only fill an in-process cache if it hasn't
+# moved. This is a plain dict on purpose: an evicted entry would read as 0 again
+# and could make a stale result look current. It holds one int per user who
+# wrote since the worker started.
+_notes_generations: Dict[ObjectId, int] = {}
+
+
+def notes_generation(user_id: ObjectId) -> int:
+    """
+    Get the current write generation of a user's notes (see `_notes_generations`).
+    """
+    return _notes_generations.get(user_id, 0)
+
+
+def get_cached_first_page(user_id: ObjectId, params: tuple) -> Optional[bytes]:
+    """
+    Get a cached serialized first-page response for a user (None on a miss).
+    """
+    pages = _first_page_cache.get(user_id)
+    return pages.get(params) if pages is not None else None
+
+
+def cache_first_page(user_id: ObjectId, params: tuple, body: bytes, generation: int) -> None:
+    """
+    Store a serialized first-page response for a user.
+    
+    `generation` is the user's write generation taken before the page was
+    read; if a write happened since, the page may be stale and isn't stored.
+    """
+    if notes_generation(user_id) != generation:
+        return
+    pages = _first_page_cache.get(user_id)
+    if pages is None:
+        pages = _first_page_cache[user_id] = {}
+    pages[params] = body
+
+
+async def _get_notes_cache_version(redis, user_id: ObjectId) -> int:
+    """
+    Get the current cache version for a user's notes (0 if never written).
+    """
+    version = await redis.get(f"notes:ver:{user_id}")
+    return int(version) if version else 0
+
+
+async def first_page_cache_version(user_id: ObjectId) -> Optional[int]:
+    """
+    Get the version a user's cached first page must be keyed by.
+    
+    Returns:
+        The user's Redis cache version when Redis is configured, 0 for a
+        single worker without Redis, or None when the first-page cache
+        can't be used safely (several workers without Redis, Redis errors).
+    """
+    redis = get_redis()
+    if redis is None:
+        return 0 if SINGLE_WORKER else None
+    
+    try:
+        return await _get_notes_cache_version(redis, user_id)
+    except RedisError:
+        return None
+
+
+async def invalidate_user_notes_cache(user_id: ObjectId, count_changed: bool = True) -> None:
+    """
+    Invalidate every cached listing/count for a user's notes.
+    
+    Must be called after any write to the user's notes. Writes that can't
+    change how many notes the user has (updates) pass count_changed=False,
+    which keeps the in-process count cache warm.
+    """
+    # Reads still in flight must not refill the in-process caches afterwards
+    _notes_generations[user_id] = notes_generation(user_id) + 1
+    _first_page_cache.pop(user_id, None)
+    if count_changed:
+        _notes_count_cache.pop(user_id, None)
+        singleflight_forget(("notes_count", user_id))
+    
+    redis = get_redis()
+    if redis is None:
+        return
+    
+    try:
+        await redis.incr(f"notes:ver:{user_id}")
+    except RedisError:
+        # Stale entries still expire on their own after NOTES_CACHE_TTL_SECONDS
+        pass
+
+
+def _adjust_cached_notes_count(user_id: ObjectId, delta: int) -> None:
+    """
+    Apply a known change to the in-process note count instead of dropping it.
+    
+    Only this worker's cached count is adjusted; if none is cached, the next
+    read counts as usual. Must be called after `invalidate_user_notes_cache`:
+    an in-flight count may predate the write, so it is forgotten (later
+    readers start a fresh one) and, since the write generation has moved on,
+    it won't overwrite the adjusted count when it finishes.
+    """
+    singleflight_forget(("notes_count", user_id))
+    count = _notes_count_cache.get(user_id)
+    if count is not None:
+        _notes_count_cache[user_id] = max(count + delta, 0)
 
 
 # =====================================================
@@ -31,38 +188,34 @@ async def create_user(user_data: UserSignUp) -> UserInDB:
     
     Detailed Flow:
     - Receives a UserSignUp object (email, password, full name).
-    - Checks if a user with the same email already exists.
-    - If unique, hashes the password before saving (NEVER store plain text).
+    - Hashes the password before saving (NEVER store plain text).
     - Inserts a new user document with timestamps and "is_active" flag.
     - Returns the newly created user wrapped in a UserInDB schema.
     - If email already exists → raises 400 BAD REQUEST.
+    
+    Duplicate emails are detected by the unique index on `email` (see
+    database.create_indexes) rejecting the insert, rather than by a separate
+    lookup first, so a successful signup costs a single round trip.
     """
     users_collection = get_users_collection()
     
-    # 1. Check for duplicate email
-    existing_user = await users_collection.find_one({"email": user_data.email})
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
-    # 2. Build user document (hashed password for security!)
+    # 1. Build user document (hashed password for security!)
     user_doc = {
         "email": user_data.email,
-        "hashed_password": get_password_hash(user_data.password),
+        "hashed_password": await get_password_hash(user_data.password),
         "full_name": user_data.full_name,
-        "created_at": datetime.utcnow(),
+        "created_at": utc_now(),
         "is_active": True
     }
     
     try:
-        # 3. Insert user into DB
+        # 2. Insert user into DB
         result = await users_collection.insert_one(user_doc)
         user_doc["_id"] = result.inserted_id
-        return UserInDB(**user_doc)
+        return UserInDB.model_construct(**user_doc)
     except DuplicateKeyError:
-        # 4. Handle edge-case of race condition: two users signing up same email simultaneously
+        # 3. Email already registered (the unique index also covers the race
+        #    of two users signing up with the same email simultaneously)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -73,38 +226,189 @@ async def create_user(user_data: UserSignUp) -> UserInDB:
 # NOTES CRUD OPERATIONS
 # =====================================================
 
-async def create_note(note_data: NoteCreate, user_id: str) -> NoteResponse:
+# Note documents are validated on the way in (NoteCreate / NoteUpdate), so
+# documents read back from MongoDB are wrapped with `model_construct`, which
+# skips re-running every validator on the hot list/read paths.
+#
+# `user_id` is always the already-parsed ObjectId of the authenticated user
+# (`current_user.id`), so it is never re-parsed from a hex string here.
+# Likewise `note_id` arrives as an ObjectId: the router rejects malformed ids
+# with a 400 before any CRUD function (or database call) runs.
+
+# List views only show a snippet of each note, so list queries never ship
+# the full `content` field: MongoDB cuts it down to this many characters.
+NOTE_PREVIEW_LENGTH = 200
+
+# Every NoteListItem field except the note text itself
+_NOTE_LIST_BASE_PROJECTION = {
+    "title": 1,
+    "tags": 1,
+    "is_favorite": 1,
+    "user_id": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "version": 1,
+}
+
+# $project stage for list queries: every NoteListItem field, with the full
+# content replaced by a server-side preview
+NOTE_LIST_PROJECTION = {
+    **_NOTE_LIST_BASE_PROJECTION,
+    "content_preview": {"$substrCP": ["$content", 0, NOTE_PREVIEW_LENGTH]},
+}
+
+# List views can ask for the full content instead (`fields=full`), e.g. to
+# render whole notes without a follow-up request per note. The preview is
+# left out then, it would only repeat the beginning of the content.
+NOTE_LIST_FULL_PROJECTION = {**_NOTE_LIST_BASE_PROJECTION, "content": 1}
+
+# ...or for no content at all (`fields=summary`), e.g. for a title-only list
+NOTE_SUMMARY_PROJECTION = {
+    "title": 1,
+    "tags": 1,
+    "is_favorite": 1,
+    "updated_at": 1,
+    "version": 1,
+}
+
+# Which note fields a list query returns
+NoteListFields = Literal["preview", "full", "summary"]
+
+# A row of a list query: NoteSummaryResponse for fields=summary, else NoteListItem
+NoteListRow = Union[NoteListItem, NoteSummaryResponse]
+
+_LIST_PROJECTIONS = {
+    "preview": NOTE_LIST_PROJECTION,
+    "full": NOTE_LIST_FULL_PROJECTION,
+    "summary": NOTE_SUMMARY_PROJECTION,
+}
+
+
+# Documents per cursor batch when streaming a page instead of loading it whole
+NOTE_STREAM_BATCH_SIZE = 20
+
+
+def _list_projection(fields: NoteListFields) -> dict:
     """
-    Create a new note for a specific user.
+    Pick the $project stage for a list query.
+    """
+    return _LIST_PROJECTIONS[fields]
+
+
+def _list_row_model(fields: NoteListFields):
+    """
+    Pick the model list query rows are wrapped in.
+    """
+    return NoteSummaryResponse if fields == "summary" else NoteListItem
+
+
+def _live_notes_filter(user_id: ObjectId) -> dict:
+    """
+    Build the filter for a user's notes that haven't been (soft) deleted.
     
-    Detailed Flow:
-    - Takes note input (title, content, tags, favorite flag).
-    - Attaches the note to a user by user_id.
-    - Initializes `created_at` and `updated_at`.
-    - Sets an initial version = 1 (used for concurrency control later).
-    - Inserts into DB, returns the saved note wrapped as NoteResponse.
+    The `is_deleted: False` equality is what lets the planner use the partial
+    (user_id, created_at, _id) index, which only contains live notes.
     """
-    notes_collection = get_notes_collection()
+    return {"user_id": user_id, "is_deleted": False}
+
+
+def _user_notes_pipeline(user_id: ObjectId, skip: int, limit: int, fields: NoteListFields) -> list:
+    """
+    Build the aggregation pipeline for one page of a user's notes (newest first).
+    """
+    return [
+        {"$match": _live_notes_filter(user_id)},
+        # _id breaks ties between notes created together (bulk imports share a
+        # timestamp), so skip/limit pages never overlap or miss a note
+        {"$sort": {"created_at": -1, "_id": -1}},
+        {"$skip": skip},
+        {"$limit": limit},
+        {"$project": _list_projection(fields)}
+    ]
+
+
+def _build_note_doc(note_data: NoteCreate, user_id: ObjectId, current_time) -> dict:
+    """
+    Build the MongoDB document for a new note.
     
-    current_time = datetime.utcnow()
-    note_doc = {
+    The `_id` is generated client-side, so the response can be built from
+    the document itself without reading anything back from the insert result.
+    """
+    return {
+        "_id": ObjectId(),
         "title": note_data.title,
         "content": note_data.content,
         "tags": note_data.tags or [],
         "is_favorite": note_data.is_favorite,
-        "user_id": ObjectId(user_id),
+        "user_id": user_id,
         "created_at": current_time,
         "updated_at": current_time,
-        "version": 1  # Start at version 1 for optimistic concurrency
+        "version": 1,  # Start at version 1 for optimistic concurrency
+        "is_deleted": False  # Deleting only flags the note (see delete_note)
     }
+
+
+async def create_note(note_data: NoteCreate, user_id: ObjectId) -> NoteResponse:
+    """
+    Create a new note for a specific user.
+    
+    Detailed Flow:
+    - Takes note input (title, content, tags, favorite flag).
+    - Attaches the note to a user by user_id.
+    - Generates the note `_id` client-side.
+    - Initializes `created_at` and `updated_at`.
+    - Sets an initial version = 1 (used for concurrency control later).
+    - Inserts into DB, invalidates the user's cached listings.
+    - Returns the saved note wrapped as NoteResponse.
+    """
+    notes_collection = get_notes_collection()
+    
+    note_doc = _build_note_doc(note_data, user_id, utc_now())
+    
+    await notes_collection.insert_one(note_doc)
+    
+    await invalidate_user_notes_cache(user_id)
+    
+    return NoteResponse.model_construct(**note_doc)
+
+
+async def create_notes_bulk(notes_data: List[NoteCreate], user_id: ObjectId) -> List[NoteResponse]:
+    """
+    Create many notes for a specific user in a single round trip.
     
-    result = await notes_collection.insert_one(note_doc)
-    note_doc["_id"] = result.inserted_id
+    Detailed Flow:
+    - Builds one document per note exactly like `create_note`
+      (client-side `_id`, shared timestamps, version = 1).
+    - Sends them all with one unordered `insert_many`, letting the server
+      insert them in any order/in parallel.
+    - Invalidates the user's cached listings once, not once per note, even
+      if the insert fails part way (some notes may have been written).
+    - Returns the saved notes wrapped as NoteResponse, in input order.
+    """
+    notes_collection = get_notes_collection()
+    
+    current_time = utc_now()
+    note_docs = [
+        _build_note_doc(note_data, user_id, current_time)
+        for note_data in notes_data
+    ]
     
-    return NoteResponse(**note_doc)
+    if note_docs:
+        try:
+            await notes_collection.insert_many(note_docs, ordered=False)
+        finally:
+            # a BulkWriteError can come after part of the batch was inserted
+            await invalidate_user_notes_cache(user_id)
+    
+    return [NoteResponse.model_construct(**note_doc) for note_doc in note_docs]
 
 
-async def get_user_notes(user_id: str, skip: int = 0, limit: int = 50) -> List[NoteResponse]:
+async def get_user_notes(
+    user_id: ObjectId,
+    skip: int = 0,
+    limit: int = 50,
+    fields: NoteListFields = "preview"
+) -> List[NoteListRow]:
     """
     Fetch all notes belonging to a user with pagination.
     
@@ -112,48 +416,125 @@ async def get_user_notes(user_id: str, skip: int = 0, limit: int = 50) -> List[N
     - Finds all notes that belong to the given user_id.
     - Applies sorting (newest first by created_at).
     - Applies skip/limit for pagination.
-    - Iterates through results and converts to NoteResponse objects.
+    - Projects away the full content, keeping only a short preview, unless
+      `fields` is "full" (whole content) or "summary" (no content at all).
+    - Fetches the page with a single `to_list` and converts to NoteListItem
+      (or NoteSummaryResponse for summaries) objects.
+    - Serves/stores the page from the Redis query-result cache when enabled.
     """
+    row_model = _list_row_model(fields)
+    list_adapter = _notes_list_adapters[row_model]
+    
+    redis = get_redis()
+    cache_key = None
+    
+    if redis is not None:
+        try:
+            version = await _get_notes_cache_version(redis, user_id)
+            cache_key = f"notes:list:{user_id}:{version}:{skip}:{limit}:{fields}"
+            cached = await redis.get(cache_key)
+            if cached is not None:
+                return list_adapter.validate_json(cached)
+        except RedisError:
+            cache_key = None
+    
     notes_collection = get_notes_collection()
     
-    cursor = notes_collection.find(
-        {"user_id": ObjectId(user_id)}
-    ).sort("created_at", -1).skip(skip).limit(limit)
+    cursor = notes_collection.aggregate(
+        _user_notes_pipeline(user_id, skip, limit, fields)
+    )
     
-    notes = []
-    async for note_doc in cursor:
-        notes.append(NoteResponse(**note_doc))
+    # Fetch the whole (already limited) page in one go instead of awaiting per document
+    note_docs = await cursor.to_list(length=limit)
+    notes = [row_model.model_construct(**note_doc) for note_doc in note_docs]
+    
+    if cache_key is not None:
+        try:
+            await redis.setex(
+                cache_key,
+                NOTES_CACHE_TTL_SECONDS,
+                list_adapter.dump_json(notes, by_alias=True)
+            )
+        except RedisError:
+            pass
     
     return notes
 
 
-async def get_note_by_id(note_id: str, user_id: str) -> Optional[NoteResponse]:
+async def iter_user_notes(
+    user_id: ObjectId,
+    skip: int = 0,
+    limit: int = 50,
+    fields: NoteListFields = "full"
+) -> AsyncIterator[NoteListItem]:
+    """
+    Stream one page of a user's notes, one note at a time.
+    
+    Detailed Flow:
+    - Same query as `get_user_notes` (newest first, skip/limit, projection).
+    - Pulls documents from the cursor in small batches and yields each as a
+      NoteListItem as soon as it arrives, so a caller can start writing the
+      response before the whole page has been read.
+    - Bypasses the Redis query-result cache, which stores whole pages.
+    """
+    notes_collection = get_notes_collection()
+    
+    cursor = notes_collection.aggregate(
+        _user_notes_pipeline(user_id, skip, limit, fields),
+        batchSize=NOTE_STREAM_BATCH_SIZE
+    )
+    
+    async for note_doc in cursor:
+        yield NoteListItem.model_construct(**note_doc)
+
+
+async def get_note_by_id(note_id: ObjectId, user_id: ObjectId) -> Optional[NoteResponse]:
     """
     Fetch a single note by its ID, only if it belongs to the given user.
     
     Detailed Flow:
     - Looks up a note where _id matches note_id AND user_id matches.
     - This ensures a user cannot access another user’s notes.
+    - Deleted notes are treated as missing.
     - If found, wraps into NoteResponse; otherwise returns None.
     """
     notes_collection = get_notes_collection()
     
-    try:
-        note_doc = await notes_collection.find_one({
-            "_id": ObjectId(note_id),
-            "user_id": ObjectId(user_id)
-        })
-        
-        if note_doc:
-            return NoteResponse(**note_doc)
-    except Exception:
-        # Could fail if note_id is not a valid ObjectId
-        pass
+    note_doc = await notes_collection.find_one({
+        "_id": note_id,
+        **_live_notes_filter(user_id)
+    })
+    
+    if note_doc:
+        return NoteResponse.model_construct(**note_doc)
+    
+    return None
+
+
+async def get_note_version(note_id: ObjectId, user_id: ObjectId) -> Optional[int]:
+    """
+    Fetch only the version of a note, only if it belongs to the given user.
+    
+    Detailed Flow:
+    - Same lookup as `get_note_by_id`, but projects the document down to
+      its version, so the title/content never leave the database.
+    - Used to answer conditional GETs (If-None-Match) without loading the note.
+    - Returns None if the note doesn't exist or belongs to someone else.
+    """
+    notes_collection = get_notes_collection()
+    
+    note_doc = await notes_collection.find_one(
+        {"_id": note_id, **_live_notes_filter(user_id)},
+        {"_id": 0, "version": 1}
+    )
+    
+    if note_doc:
+        return note_doc.get("version")
     
     return None
 
 
-async def update_note(note_id: str, user_id: str, note_update: NoteUpdate) -> NoteResponse:
+async def update_note(note_id: ObjectId, user_id: ObjectId, note_update: NoteUpdate) -> NoteResponse:
     """
     Update a note using optimistic concurrency control (OCC).
     
@@ -166,102 +547,127 @@ async def update_note(note_id: str, user_id: str, note_update: NoteUpdate) -> No
     Detailed Flow:
     - Builds an update_doc with only provided fields.
     - Sets new updated_at timestamp.
-    - If a version is included, it’s added to the filter query (ensuring OCC).
-    - Uses atomic `find_one_and_update` so DB guarantees only one succeeds.
-    - If no match found → either note doesn’t exist OR version mismatch.
-    - Returns updated note if successful.
+    - If a version is included, runs an aggregation-pipeline update that only
+      applies the changes when the stored version matches, and asks for the
+      document as it was *before* the update. In a single round trip:
+        • no document → note doesn’t exist (404)
+        • stored version ≠ given version → conflict (409), nothing changed
+        • otherwise → the update was applied
+    - Without a version, does a plain atomic `find_one_and_update`.
+    - Invalidates the user's cached listings and returns the updated note if successful.
     """
     notes_collection = get_notes_collection()
     
-    try:
-        # 1. Build update document
-        update_doc = {"updated_at": datetime.utcnow()}
-        
-        if note_update.title is not None:
-            update_doc["title"] = note_update.title
-        if note_update.content is not None:
-            update_doc["content"] = note_update.content
-        if note_update.tags is not None:
-            update_doc["tags"] = note_update.tags
-        if note_update.is_favorite is not None:
-            update_doc["is_favorite"] = note_update.is_favorite
+    # 1. Build update document
+    update_doc = {"updated_at": utc_now()}
+    
+    if note_update.title is not None:
+        update_doc["title"] = note_update.title
+    if note_update.content is not None:
+        update_doc["content"] = note_update.content
+    if note_update.tags is not None:
+        update_doc["tags"] = note_update.tags
+    if note_update.is_favorite is not None:
+        update_doc["is_favorite"] = note_update.is_favorite
+    
+    # 2. Filter: must match correct note_id + user_id (deleted notes can't be edited)
+    filter_doc = {
+        "_id": note_id,
+        **_live_notes_filter(user_id)
+    }
+    
+    not_found = HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Note not found"
+    )
+    
+    if note_update.version is not None:
+        # 3. Enforce optimistic concurrency inside the update itself:
+        #    every field only changes if the stored version matches.
+        #    Values are wrapped in $literal so user text like "$title"
+        #    is never interpreted as a field path.
+        expected_version = note_update.version
+        version_matches = {"$eq": ["$version", expected_version]}
         
-        # 2. Filter: must match correct note_id + user_id
-        filter_doc = {
-            "_id": ObjectId(note_id),
-            "user_id": ObjectId(user_id)
+        pipeline_set = {
+            field: {"$cond": [version_matches, {"$literal": value}, f"${field}"]}
+            for field, value in update_doc.items()
+        }
+        pipeline_set["version"] = {
+            "$cond": [version_matches, {"$add": ["$version", 1]}, "$version"]
         }
         
-        # 3. Enforce optimistic concurrency: match version too if provided
-        if note_update.version is not None:
-            filter_doc["version"] = note_update.version
-            update_doc["$inc"] = {"version": 1}
-        else:
-            update_doc["$inc"] = {"version": 1}
-        
-        # 4. Perform atomic update
-        result = await notes_collection.find_one_and_update(
+        # 4. Perform atomic update, returning the pre-update document
+        previous = await notes_collection.find_one_and_update(
             filter_doc,
-            {"$set": update_doc, "$inc": update_doc.get("$inc", {})},
-            return_document=True  # Ask DB to return updated document
+            [{"$set": pipeline_set}],
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result is None:
-            # 5. Determine why update failed
-            existing_note = await notes_collection.find_one({
-                "_id": ObjectId(note_id),
-                "user_id": ObjectId(user_id)
-            })
-            
-            if existing_note:
-                # Note exists but version mismatch → conflict
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="Note was modified by another operation. Please refresh and try again."
-                )
-            else:
-                # Note does not exist at all
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Note not found"
-                )
+        if previous is None:
+            # Note does not exist at all
+            raise not_found
         
-        return NoteResponse(**result)
+        if previous.get("version") != expected_version:
+            # Note exists but version mismatch → conflict
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Note was modified by another operation. Please refresh and try again."
+            )
         
-    except ValueError:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid note ID format"
+        # 5. The update was applied; rebuild the new state locally
+        result = {**previous, **update_doc, "version": expected_version + 1}
+    else:
+        # 3. Perform atomic update (no version check requested).
+        #    Update operators stay separate: field changes go in $set,
+        #    the version bump in $inc.
+        result = await notes_collection.find_one_and_update(
+            filter_doc,
+            {"$set": update_doc, "$inc": {"version": 1}},
+            return_document=ReturnDocument.AFTER  # Ask DB to return updated document
         )
+        
+        if result is None:
+            raise not_found
+    
+    # An update never changes how many notes the user has
+    await invalidate_user_notes_cache(user_id, count_changed=False)
+    
+    return NoteResponse.model_construct(**result)
 
 
-async def delete_note(note_id: str, user_id: str) -> bool:
+async def delete_note(note_id: ObjectId, user_id: ObjectId) -> bool:
     """
-    Delete a note (atomic).
+    Delete a note (atomic soft delete).
     
     Detailed Flow:
-    - Tries to delete a note with both note_id and user_id.
+    - Flags a live note matching both note_id and user_id as deleted with a
+      single find_one_and_update (only its _id is projected back), which
+      returns None when nothing matched. The note drops out of the partial
+      index every read goes through; MongoDB purges the tombstone later via
+      the TTL index on `deleted_at`.
     - Ensures users can delete only their own notes.
+    - Invalidates the user's cached listings on success, but decrements the
+      in-process note count instead of dropping it, so reloading the list
+      right after a delete doesn't have to count again.
     - Returns True if deleted, False if not found.
-    - Raises 400 if note_id is not valid.
     """
     notes_collection = get_notes_collection()
     
-    try:
-        result = await notes_collection.delete_one({
-            "_id": ObjectId(note_id),
-            "user_id": ObjectId(user_id)
-        })
-        
-        return result.deleted_count > 0
-    except ValueError:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid note ID format"
-        )
+    deleted_doc = await notes_collection.find_one_and_update(
+        {"_id": note_id, **_live_notes_filter(user_id)},
+        {"$set": {"is_deleted": True, "deleted_at": utc_now()}},
+        projection={"_id": 1}
+    )
+    
+    if deleted_doc is not None:
+        await invalidate_user_notes_cache(user_id, count_changed=False)
+        _adjust_cached_notes_count(user_id, -1)
+        return True
+    return False
 
 
-async def get_user_notes_count(user_id: str) -> int:
+async def get_user_notes_count(user_id: ObjectId) -> int:
     """
     Count how many notes a user owns.
     
@@ -271,46 +677,181 @@ async def get_user_notes_count(user_id: str) -> int:
     - Analytics
     
     Detailed Flow:
-    - Runs a count_documents query filtered by user_id.
+    - Runs a count_documents query for the user's live (not deleted) notes,
+      hinted (by name) onto the partial live-notes index so the planner
+      never considers anything else for a plain per-user count.
+    - Serves/stores the count from a short-lived in-process cache first, then
+      from the Redis query-result cache when enabled.
+    - Concurrent misses for the same user (e.g. several tabs refreshing at
+      once) share a single lookup instead of each issuing the same count.
     - Returns integer count.
     """
+    count = _notes_count_cache.get(user_id)
+    if count is not None:
+        return count
+    
+    return await singleflight(
+        ("notes_count", user_id),
+        lambda: _load_user_notes_count(user_id)
+    )
+
+
+async def _load_user_notes_count(user_id: ObjectId) -> int:
+    """
+    Count a user's notes via the Redis cache or MongoDB, refilling both caches.
+    
+    The in-process cache is only refilled if no write to the user's notes
+    happened while counting; otherwise the count is returned but not kept.
+    """
+    generation = notes_generation(user_id)
+    redis = get_redis()
+    cache_key = None
+    
+    if redis is not None:
+        try:
+            version = await _get_notes_cache_version(redis, user_id)
+            cache_key = f"notes:count:{user_id}:{version}"
+            cached = await redis.get(cache_key)
+            if cached is not None:
+                count = int(cached)
+                if notes_generation(user_id) == generation:
+                    _notes_count_cache[user_id] = count
+                return count
+        except RedisError:
+            cache_key = None
+    
     notes_collection = get_notes_collection()
     
-    count = await notes_collection.count_documents({
-        "user_id": ObjectId(user_id)
-    })
+    count = await notes_collection.count_documents(
+        _live_notes_filter(user_id),
+        hint=LIVE_NOTES_INDEX_NAME
+    )
+    
+    if cache_key is not None:
+        try:
+            await redis.setex(cache_key, NOTES_CACHE_TTL_SECONDS, count)
+        except RedisError:
+            pass
+    
+    if notes_generation(user_id) == generation:
+        _notes_count_cache[user_id] = count
     
     return count
 
 
-async def search_user_notes(user_id: str, search_query: str, skip: int = 0, limit: int = 50) -> List[NoteResponse]:
+def _text_search_filter(user_id: ObjectId, search_query: str) -> dict:
+    """
+    Build the indexed `$text` search filter for a user's notes.
+    """
+    return {
+        **_live_notes_filter(user_id),
+        "$text": {"$search": search_query}
+    }
+
+
+def _substring_search_filter(user_id: ObjectId, search_query: str) -> dict:
+    """
+    Build the case-insensitive substring search filter for a user's notes.
+    
+    The query is escaped, so user input is matched literally and can never
+    inject regex syntax (or a catastrophic-backtracking pattern). `tags` is
+    matched directly against the pattern, which checks each array element.
+    """
+    pattern = Regex(re.escape(search_query), "i")
+    return {
+        **_live_notes_filter(user_id),
+        "$or": [
+            {"title": pattern},
+            {"content": pattern},
+            {"tags": pattern}
+        ]
+    }
+
+
+async def search_user_notes(
+    user_id: ObjectId,
+    search_query: str,
+    skip: int = 0,
+    limit: int = 50,
+    fields: NoteListFields = "preview"
+) -> List[NoteListRow]:
     """
     Search notes for a user by keyword.
     
     Detailed Flow:
     - Matches notes that belong to the user.
-    - Performs case-insensitive regex search on:
-        • Title
-        • Content
-        • Tags
+    - Fast path: runs a MongoDB `$text` search (backed by the per-user text
+      index on title, content and tags), ordered by relevance (text score)
+      with a deterministic tie-break, with skip/limit applied in the database.
+    - `$text` only matches whole words, so a half-typed word from
+      search-as-you-type finds nothing. Only when the text search has no
+      hits at all, falls back to an escaped, case-insensitive substring
+      match (newest first), limited to the user's own notes.
     - Applies skip/limit for pagination.
-    - Returns results as NoteResponse list.
+    - Projects away the full content, keeping only a short preview, unless
+      `fields` is "full" (whole content) or "summary" (no content at all).
+    - Returns results as NoteListItem (or NoteSummaryResponse) list.
     """
     notes_collection = get_notes_collection()
     
-    filter_doc = {
-        "user_id": ObjectId(user_id),
-        "$or": [
-            {"title": {"$regex": search_query, "$options": "i"}},
-            {"content": {"$regex": search_query, "$options": "i"}},
-            {"tags": {"$in": [{"$regex": search_query, "$options": "i"}]}}
-        ]
-    }
+    text_filter = _text_search_filter(user_id, search_query)
+    projection = _list_projection(fields)
     
-    cursor = notes_collection.find(filter_doc).sort("created_at", -1).skip(skip).limit(limit)
+    cursor = notes_collection.aggregate([
+        {"$match": text_filter},
+        # Relevance first; notes with equal scores are ordered newest first
+        # (then by _id) so skip/limit pages never overlap or miss a note
+        {"$sort": {"score": {"$meta": "textScore"}, "created_at": -1, "_id": -1}},
+        {"$skip": skip},
+        {"$limit": limit},
+        {"$project": projection}
+    ])
     
-    notes = []
-    async for note_doc in cursor:
-        notes.append(NoteResponse(**note_doc))
+    # Fetch the whole (already limited) page in one go instead of awaiting per document
+    note_docs = await cursor.to_list(length=limit)
+    
+    if not note_docs:
+        # An empty later page may just be past the end of the text results;
+        # only fall back if the text search matches nothing at all
+        has_text_matches = skip > 0 and await notes_collection.find_one(
+            text_filter, {"_id": 1}
+        ) is not None
+        
+        if not has_text_matches:
+            cursor = notes_collection.aggregate([
+                {"$match": _substring_search_filter(user_id, search_query)},
+                {"$sort": {"created_at": -1, "_id": -1}},
+                {"$skip": skip},
+                {"$limit": limit},
+                {"$project": projection}
+            ])
+            note_docs = await cursor.to_list(length=limit)
+    
+    row_model = _list_row_model(fields)
+    notes = [row_model.model_construct(**note_doc) for note_doc in note_docs]
     
     return notes
+
+
+async def count_search_user_notes(user_id: ObjectId, search_query: str) -> int:
+    """
+    Count how many of a user's notes match a keyword search.
+    
+    Detailed Flow:
+    - Counts `$text` matches first (served by the per-user text index).
+    - Only when there are none, counts the substring fallback matches, i.e.
+      the same rule `search_user_notes` uses to decide which results to return.
+    - Returns integer count.
+    """
+    notes_collection = get_notes_collection()
+    
+    count = await notes_collection.count_documents(
+        _text_search_filter(user_id, search_query)
+    )
+    
+    if count == 0:
+        count = await notes_collection.count_documents(
+            _substring_search_filter(user_id, search_query)
+        )
+    
+    return count
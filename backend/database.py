@@ -6,6 +6,7 @@ This module is responsible for:
 2. Initializing and storing a reference to the database.
 3. Creating required indexes for collections (users, notes).
 4. Exposing helper functions to access specific collections (users, notes).
+5. Managing the optional Redis connection used as a query-result cache.
 
 It ensures that:
 - The database connection is established before the app starts serving requests.
@@ -13,9 +14,14 @@ It ensures that:
 - Indexes are created upfront for query performance and data integrity.
 """
 
+import asyncio
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import ConnectionFailure
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure, PyMongoError
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from utils import utc_now
 import logging
 
 # -------------------------
@@ -37,6 +43,34 @@ MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 # Name of the database that will store all collections.
 DATABASE_NAME = os.getenv("DATABASE_NAME", "notes_app")
 
+# Connection pool settings, tunable per deployment. Keeping a minimum number of
+# connections open means a burst of requests right after startup doesn't pay
+# for TCP/TLS/auth handshakes; the pool is also pre-warmed at startup.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL", "200"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL", "10"))
+# Close connections idle for longer than this instead of letting them linger
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+# Fail fast instead of hanging when no server is reachable...
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+# ...or when every pooled connection is busy
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+
+# Wire-protocol compression (shrinks note content on the wire). zstd needs the
+# `zstandard` package; zlib is built in and used if the server lacks zstd.
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,zlib")
+
+# Index creation is retried at startup until MongoDB is reachable (e.g. when it
+# boots alongside the app in docker-compose), then startup fails: the unique
+# 'email' index is what prevents duplicate accounts, so the app must never
+# serve requests without it. Each attempt also waits up to the server
+# selection timeout above.
+MONGO_STARTUP_ATTEMPTS = int(os.getenv("MONGO_STARTUP_ATTEMPTS", "10"))
+MONGO_STARTUP_RETRY_DELAY_SECONDS = float(os.getenv("MONGO_STARTUP_RETRY_DELAY", "2"))
+
+# Connection URL for Redis. Optional: when unset, the query-result cache is
+# disabled and every read goes straight to MongoDB.
+REDIS_URL = os.getenv("REDIS_URL")
+
 # -------------------------
 # Global Client + Database
 # -------------------------
@@ -46,41 +80,94 @@ DATABASE_NAME = os.getenv("DATABASE_NAME", "notes_app")
 client: AsyncIOMotorClient = None
 database = None
 
+# Collection objects are resolved once at startup. Looking them up through
+# `database.<name>` builds a new collection object on every access, which
+# would otherwise happen on every CRUD call.
+users_collection = None
+notes_collection = None
+redis_client: Redis = None
 
-async def connect_to_mongo():
-    """
-    Create a connection to MongoDB and set up the database instance.
+# Background connectivity check / pool warmup started at startup
+_warmup_task: asyncio.Task = None
 
-    Steps:
-    1. Initialize the MongoDB client with the provided connection string.
-    2. Run the 'ismaster' command to confirm the server is reachable.
-    3. Store the database instance globally for app-wide use.
-    4. Create indexes to enforce uniqueness and improve performance.
 
-    Raises:
-        ConnectionFailure: If the database server cannot be reached.
+async def warm_up_mongo():
+    """
+    Check the MongoDB server is reachable and seed the connection pool.
+
+    Runs as a background task started by `connect_to_mongo`, so application
+    startup doesn't wait on cold DNS/TLS handshakes. Failures are logged,
+    not raised: requests will surface connection errors on their own.
     """
-    global client, database
     try:
-        # Initialize the async MongoDB client
-        client = AsyncIOMotorClient(MONGODB_URL)
+        # 'hello' is the lightweight handshake command (replaces the
+        # deprecated 'ismaster') and doesn't require authentication
+        await client.admin.command('hello')
+        logger.info(f"✅ Successfully connected to MongoDB at {MONGODB_URL}")
 
-        # Run a simple command to check if the connection is alive
-        # 'ismaster' is a lightweight operation that doesn't require authentication
-        await client.admin.command('ismaster')
+        # Concurrent pings each need their own connection, which seeds the pool
+        await asyncio.gather(*[
+            client.admin.command('ping') for _ in range(MONGO_MIN_POOL_SIZE)
+        ])
+    except PyMongoError as e:
+        logger.error(f"❌ Failed to connect to MongoDB: {e}")
 
-        # Get reference to the app database (like schema in SQL)
-        database = client[DATABASE_NAME]
 
-        logger.info(f"✅ Successfully connected to MongoDB at {MONGODB_URL}")
+async def connect_to_mongo():
+    """
+    Create a connection to MongoDB and set up the database instance.
 
-        # Set up required indexes (unique constraints, performance improvements)
-        await create_indexes()
+    Steps:
+    1. Initialize the MongoDB client with the provided connection string.
+    2. Store the database instance globally for app-wide use.
+    3. Start a background task that runs 'hello' to confirm the server is
+       reachable and pre-warms the connection pool.
+    4. Create indexes to enforce uniqueness and improve performance,
+       retrying while the server is still unreachable.
 
-    except ConnectionFailure as e:
-        # Log and re-raise the error if the connection fails
-        logger.error(f"❌ Failed to connect to MongoDB: {e}")
-        raise e
+    Raises:
+        PyMongoError: If the indexes still can't be created after
+            MONGO_STARTUP_ATTEMPTS attempts (the app must not start then).
+    """
+    global client, database, users_collection, notes_collection, _warmup_task
+    # Initialize the async MongoDB client
+    client = AsyncIOMotorClient(
+        MONGODB_URL,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        retryWrites=True,
+        compressors=MONGO_COMPRESSORS
+    )
+
+    # Get reference to the app database (like schema in SQL)
+    database = client[DATABASE_NAME]
+
+    # Resolve the collections once for the whole app lifetime
+    users_collection = database.users
+    notes_collection = database.notes
+
+    # Connectivity check + pool warmup without blocking startup
+    # (a reference is kept so the task isn't garbage collected mid-flight)
+    _warmup_task = asyncio.create_task(warm_up_mongo())
+
+    # Set up required indexes (unique constraints, performance improvements).
+    # This is what actually gates startup on MongoDB being reachable.
+    for attempt in range(1, MONGO_STARTUP_ATTEMPTS + 1):
+        try:
+            await create_indexes()
+            return
+        except PyMongoError as e:
+            if attempt == MONGO_STARTUP_ATTEMPTS:
+                logger.error(f"❌ Failed to create indexes, giving up: {e}")
+                raise
+            logger.warning(
+                f"⚠️ Failed to create indexes (attempt {attempt}/{MONGO_STARTUP_ATTEMPTS}), "
+                f"retrying in {MONGO_STARTUP_RETRY_DELAY_SECONDS}s: {e}"
+            )
+            await asyncio.sleep(MONGO_STARTUP_RETRY_DELAY_SECONDS)
 
 
 async def close_mongo_connection():
@@ -92,11 +179,121 @@ async def close_mongo_connection():
     - We don't leave open connections, which can cause issues if the app restarts.
     """
     global client
+    if _warmup_task and not _warmup_task.done():
+        # Shutting down before the warmup finished: nothing left to warm
+        _warmup_task.cancel()
     if client:
         client.close()
         logger.info("🔌 Disconnected from MongoDB")
 
 
+async def connect_to_redis():
+    """
+    Create a connection to Redis for caching query results.
+
+    Redis is an optimisation, not a requirement: if REDIS_URL is not set or
+    the server cannot be reached, the app keeps running without a cache.
+    """
+    global redis_client
+    if not REDIS_URL:
+        logger.info("ℹ️ REDIS_URL not set, query-result cache disabled")
+        return
+
+    redis = Redis.from_url(REDIS_URL)
+    try:
+        await redis.ping()
+        redis_client = redis
+        logger.info(f"✅ Successfully connected to Redis at {REDIS_URL}")
+    except RedisError as e:
+        # Not fatal, reads simply fall back to MongoDB (the unused client
+        # still holds a connection pool, so release it)
+        await redis.aclose()
+        logger.warning(f"⚠️ Failed to connect to Redis, cache disabled: {e}")
+
+
+async def close_redis_connection():
+    """
+    Close the Redis connection when the application shuts down.
+    """
+    global redis_client
+    if redis_client:
+        await redis_client.aclose()
+        redis_client = None
+        logger.info("🔌 Disconnected from Redis")
+
+
+# Indexes that older versions of the app created on 'notes' and that are now
+# redundant. The plain (user_id, created_at) index was replaced by a partial
+# (user_id, created_at, _id) one that only holds live (not soft-deleted) notes,
+# which every per-user query goes through. The standalone 'user_id' index is
+# covered by the left prefix of that index, so keeping it around would only add
+# an extra B-tree to maintain on every write.
+LEGACY_NOTE_INDEXES = (
+    "user_id_1",
+    "user_id_1_created_at_-1",
+)
+
+# Name of the partial (user_id, created_at, _id) index over live notes. It is
+# named explicitly, so queries can hint it by name and it can never be
+# mistaken for the legacy index above.
+LIVE_NOTES_INDEX_NAME = "user_id_1_created_at_-1__id_-1_live"
+
+# Soft-deleted notes ("tombstones") are purged by MongoDB this long after deletion
+NOTE_TOMBSTONE_TTL_SECONDS = 30 * 24 * 60 * 60
+
+
+# Marker document (in the 'migrations' collection) recording that the
+# soft-delete backfill below has run, so later startups skip it
+NOTE_DELETED_FLAG_MIGRATION = "notes_is_deleted_backfill"
+
+
+async def backfill_note_deleted_flags():
+    """
+    Mark notes created before soft delete existed as live (is_deleted: False).
+    
+    Live-note queries match `is_deleted: False` exactly (so they can use the
+    partial index), which a note without the field would never match. The
+    filter on a missing field can't use an index, so this scans the whole
+    collection; it runs once and is then recorded in the 'migrations'
+    collection, so later startups only pay for one `find_one`. (Workers
+    starting together may each run it once; it is idempotent.)
+    
+    Notes inserted without the flag after this ran stay invisible: stop
+    instances running older versions of the app before upgrading, and have
+    direct imports set `is_deleted: false`.
+    """
+    migrations = database.migrations
+    if await migrations.find_one({"_id": NOTE_DELETED_FLAG_MIGRATION}) is not None:
+        return
+    
+    result = await notes_collection.update_many(
+        {"is_deleted": {"$exists": False}},
+        {"$set": {"is_deleted": False}}
+    )
+    logger.info(f"🏷️ Marked {result.modified_count} existing notes as live")
+    
+    await migrations.update_one(
+        {"_id": NOTE_DELETED_FLAG_MIGRATION},
+        {"$setOnInsert": {"applied_at": utc_now()}},
+        upsert=True
+    )
+
+
+async def drop_legacy_indexes():
+    """
+    Drop redundant indexes left behind on existing deployments.
+
+    Missing indexes are ignored, so this is safe to run on every startup.
+    """
+    for name in LEGACY_NOTE_INDEXES:
+        try:
+            await notes_collection.drop_index(name)
+            logger.info(f"🧹 Dropped legacy index '{name}' on notes")
+        except OperationFailure:
+            # Index doesn't exist (fresh database or already dropped)
+            pass
+
+
 async def create_indexes():
     """
     Create necessary database indexes for performance and integrity.
@@ -104,30 +301,72 @@ async def create_indexes():
     Indexes used:
     1. Users collection:
        - Unique index on 'email' to ensure no duplicate registrations.
-    2. Notes collection:
-       - Index on 'user_id' to quickly fetch notes by user.
-       - Compound index on (user_id, created_at) for queries like:
-         "get the most recent notes for this user."
+    2. Notes collection (sent as a single createIndexes command):
+       - Partial compound index on (user_id, created_at, _id) for queries like:
+         "get the most recent notes for this user." The trailing '_id' key
+         covers the tie-break between notes sharing a timestamp.
+         Its 'user_id' prefix also serves plain "notes of this user" lookups,
+         so no separate single-field 'user_id' index is needed. It only
+         holds live notes (is_deleted: False), so soft-deleted notes cost
+         nothing on list/count queries, which all filter on that flag.
+       - TTL index on 'deleted_at' (only set on soft-deleted notes) so
+         MongoDB purges tombstones on its own after a while.
+       - Text index on (title, content, tags) prefixed with an equality key
+         on 'user_id', so keyword search only walks the requesting user's
+         entries instead of matching across every user and filtering after.
+         Queries using `$text` must then include an equality on 'user_id'.
+
+    The users index comes first, then the notes migration (backfilling the
+    soft-delete flag, dropping legacy indexes) and the notes indexes. Every
+    index is requested with background=True so that older servers don't
+    hold a collection lock while building on a large existing collection
+    (4.2+ ignores the flag and always uses its optimized build).
 
     Benefits:
     - Enforces data consistency (unique email).
     - Makes queries faster by reducing scan time.
-    """
-    try:
-        # Users: prevent duplicate email registrations
-        await database.users.create_index("email", unique=True)
 
-        # Notes: allow fast lookup of notes belonging to a specific user
-        await database.notes.create_index("user_id")
-
-        # Notes: allow efficient queries sorted by creation time (per user)
-        await database.notes.create_index([("user_id", 1), ("created_at", -1)])
-
-        logger.info("📑 Database indexes created successfully")
-
-    except Exception as e:
-        # Not fatal, but log if something goes wrong during index creation
-        logger.warning(f"⚠️ Failed to create indexes: {e}")
+    Raises:
+        PyMongoError: If any index can't be created (handled by the retry
+            loop in `connect_to_mongo`).
+    """
+    # Users: prevent duplicate email registrations. Built first, so that
+    # nothing in the notes migration below can keep it from existing.
+    await users_collection.create_index("email", unique=True, background=True)
+
+    # Notes: flag unflagged notes as live before anything relies on the flag
+    await backfill_note_deleted_flags()
+    await drop_legacy_indexes()
+
+    # Notes: all indexes in one round trip
+    await notes_collection.create_indexes([
+        # Efficient per-user queries sorted by creation time (live notes only)
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name=LIVE_NOTES_INDEX_NAME,
+            partialFilterExpression={"is_deleted": False},
+            background=True,
+        ),
+        # Purge soft-deleted notes some time after deletion
+        IndexModel(
+            [("deleted_at", ASCENDING)],
+            expireAfterSeconds=NOTE_TOMBSTONE_TTL_SECONDS,
+            background=True,
+        ),
+        # Per-user full-text search over title, content and tags
+        # (equality prefix first, then the text keys)
+        IndexModel(
+            [
+                ("user_id", ASCENDING),
+                ("title", TEXT),
+                ("content", TEXT),
+                ("tags", TEXT),
+            ],
+            background=True,
+        ),
+    ])
+
+    logger.info("📑 Database indexes created successfully")
 
 
 def get_database():
@@ -140,6 +379,16 @@ def get_database():
     return database
 
 
+def get_redis():
+    """
+    Get the Redis client used for caching.
+
+    Returns:
+        Redis async client, or None when caching is disabled.
+    """
+    return redis_client
+
+
 # -------------------------
 # Collection Shortcuts
 # -------------------------
@@ -153,7 +402,7 @@ def get_users_collection():
     Returns:
         Motor async collection object for users.
     """
-    return database.users
+    return users_collection
 
 
 def get_notes_collection():
@@ -163,4 +412,4 @@ def get_notes_collection():
     Returns:
         Motor async collection object for notes.
     """
-    return database.notes
+    return notes_collection
@@ -13,12 +13,20 @@ Responsibilities:
 In short: This is the file that ties everything together.
 """
 
-from fastapi import FastAPI
+import logging
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
-from database import close_mongo_connection, connect_to_mongo
+from pymongo.errors import PyMongoError
+from database import (
+    close_mongo_connection, connect_to_mongo,
+    close_redis_connection, connect_to_redis
+)
 from routers import auth, notes
 
+logger = logging.getLogger(__name__)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -30,8 +38,10 @@ async def lifespan(app: FastAPI):
       - AFTER the application finishes (shutdown).
 
     Here’s what we do:
-    - On startup: Connect to MongoDB so the app has a working DB connection.
-    - On shutdown: Gracefully close the MongoDB connection to free resources.
+    - On startup: Connect to MongoDB so the app has a working DB connection
+      (the connectivity check and pool warmup continue in the background),
+      and to Redis (if configured) for caching query results.
+    - On shutdown: Gracefully close both connections to free resources.
 
     Using `@asynccontextmanager` makes this clean and ensures
     both startup and shutdown logic are neatly paired together.
@@ -40,6 +50,7 @@ async def lifespan(app: FastAPI):
     # Startup logic
     # ------------------------
     await connect_to_mongo()  # Create DB client, test connection, build indexes
+    await connect_to_redis()  # Optional query-result cache
     
     # Yield control back to FastAPI (the app runs here in between)
     yield
@@ -47,6 +58,7 @@ async def lifespan(app: FastAPI):
     # ------------------------
     # Shutdown logic
     # ------------------------
+    await close_redis_connection()  # Release cache connection
     await close_mongo_connection()  # Release DB resources, close connections
 
 
@@ -56,11 +68,14 @@ async def lifespan(app: FastAPI):
 # Create the main application object.
 # - `title`, `description`, and `version` appear in auto-generated docs (/docs, /redoc).
 # - `lifespan` links our startup/shutdown manager to the app.
+# - `default_response_class` serializes every response with orjson, which is
+#   considerably faster than the stdlib json module and writes bytes directly.
 app = FastAPI(
     title="Notes API",
     description="A simple notes API with JWT authentication",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 
@@ -81,6 +96,25 @@ app.add_middleware(
 )
 
 
+# ------------------------
+# Error Handling
+# ------------------------
+# Database failures are turned into a 500 here, once for the whole app,
+# instead of every route wrapping its body in its own try/except. Routes only
+# raise HTTPException for the errors they expect (404, 409, ...); anything
+# else that isn't a database error falls through to Starlette's default 500.
+@app.exception_handler(PyMongoError)
+async def mongo_error_handler(request: Request, exc: PyMongoError):
+    """
+    Return a generic 500 for database errors without leaking driver details.
+    """
+    logger.error(f"❌ Database error on {request.method} {request.url.path}: {exc}")
+    return ORJSONResponse(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content={"detail": "Database error, please try again later"}
+    )
+
+
 # ------------------------
 # Health Check Endpoint
 # ------------------------
@@ -116,6 +150,21 @@ app.include_router(notes.router, prefix="/notes", tags=["notes"])
 # ------------------------
 # If you run this file directly with `python main.py`, it will start uvicorn.
 # Normally, in production, you'd use `uvicorn main:app --reload` from the terminal.
+# - The event loop and HTTP parser are left on uvicorn's "auto" default, which
+#   already picks uvloop and httptools when they're installed (uvicorn[standard])
+#   and falls back to asyncio + h11 where they aren't (e.g. uvloop on Windows).
+# - `workers`: a single process by default. Set WEB_CONCURRENCY (also read by
+#   the uvicorn/gunicorn CLIs) to run more, e.g. one per CPU core, since a single
+#   process only ever uses one core. Every worker runs the startup index
+#   migration itself, concurrently, and the in-process first-page cache is only
+#   used with Redis configured (see crud.py). Multiple workers need the app as
+#   an import string so each worker can import it itself.
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
@@ -6,7 +6,7 @@ user signup, login, and token management.
 """
 
 from datetime import timedelta #this is to set time for jwt token expiration
-from fastapi import APIRouter, HTTPException, status, Depends #basically for the routing
+from fastapi import APIRouter, HTTPException, status, Depends, Request #basically for the routing
 # and to manage dependecies and handle errors
 from schemas import (
     UserSignUp, UserLogin, AuthResponse, UserResponse, 
@@ -14,10 +14,11 @@ from schemas import (
 )  #these are models that we have defined basically in our schemas.py folder which are pydantic models
 # have different functionalities
 from auth import (
-    authenticate_user, create_access_token, get_current_active_user,
+    authenticate_user, issue_access_token, get_current_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 ) # these are the functions for authentication from auth.py
 from crud import create_user #this is basically one of the 4 functions to create user from crud
+from utils import etag_json_response, model_json_response # to send the user info with an etag so the browser can revalidate
 
 router = APIRouter() # this basically acts as the main point of entry or call for the routing purpose
 #similar to express in mern
@@ -48,42 +49,36 @@ async def signup(user_data: UserSignUp):
     Raises:
         HTTPException: If email is already registered
     """
-    try:
-        # Create new user in database
-        user = await create_user(user_data)
-        
-        # Create access token this also puts time = time delta as the access token expiry 
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": str(user.id)}, # this is the payload for the jwt here we are using id as the payload
-            expires_delta=access_token_expires
-        )
-        
-        # Prepare user response (exclude sensitive data)
+    # Create new user in database (duplicate emails raise a 400 from create_user,
+    # db errors are turned into a 500 by the handler registered in main.py)
+    user = await create_user(user_data)
+    
+    # Create access token this also puts time = time delta as the access token expiry 
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = await issue_access_token(
+        user.id_str, # the token (jwt payload or redis session) identifies the user by id
+        expires_delta=access_token_expires
+    )
+    
+    # Prepare user response (exclude sensitive data)
 
-        #here we are taking different fields basedon the input  of the user
-        user_response = UserResponse(
-            id=user.id,
-            email=user.email,
-            full_name=user.full_name,
-            created_at=user.created_at,
-            is_active=user.is_active
-        )
-        
-        return AuthResponse(
-            access_token=access_token,
-            token_type="bearer", #this is basically showing that it is the bearer of the token that it is a part of
-            expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,  # Convert to seconds
-            user=user_response
-        )
-        
-    except HTTPException: #this is again a part of try catch only incase this error pops up here we re raise it
-        raise
-    except Exception as e: # this is where any unexpected error is caught like db errors or stack traces
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to create user account"
-        )
+    #here we are taking different fields basedon the input  of the user
+    #model_construct skips validation, the user just came out of our own db layer
+    user_response = UserResponse.model_construct(
+        id=user.id,
+        email=user.email,
+        full_name=user.full_name,
+        created_at=user.created_at,
+        is_active=user.is_active
+    )
+    
+    #we serialize it ourselves so fastapi doesnt validate the whole thing again through response_model
+    return model_json_response(AuthResponse.model_construct(
+        access_token=access_token,
+        token_type="bearer", #this is basically showing that it is the bearer of the token that it is a part of
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,  # Convert to seconds
+        user=user_response
+    ))
 
 
 @router.post(
@@ -123,13 +118,13 @@ async def login(user_credentials: UserLogin):
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": str(user.id)},
+    access_token = await issue_access_token(
+        user.id_str,
         expires_delta=access_token_expires
     )
     
-    # Prepare user response (exclude sensitive data)
-    user_response = UserResponse(
+    # Prepare user response (exclude sensitive data); already-trusted data so no re-validation
+    user_response = UserResponse.model_construct(
         id=user.id,
         email=user.email,
         full_name=user.full_name,
@@ -137,12 +132,12 @@ async def login(user_credentials: UserLogin):
         is_active=user.is_active
     )
     
-    return AuthResponse(
+    return model_json_response(AuthResponse.model_construct(
         access_token=access_token,
         token_type="bearer",
         expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,  # Convert to seconds
         user=user_response
-    )
+    ))
 
 
 @router.get(
@@ -153,7 +148,7 @@ async def login(user_credentials: UserLogin):
         400: {"model": ErrorResponse, "description": "Inactive user"}
     }
 )
-async def get_current_user_info(current_user = Depends(get_current_active_user)):
+async def get_current_user_info(request: Request, current_user = Depends(get_current_user)):
     """
     Get current authenticated user information
     
@@ -161,15 +156,18 @@ async def get_current_user_info(current_user = Depends(get_current_active_user))
     currently authenticated user using their JWT token.
     
     Args:
+        request: Incoming request (for If-None-Match)
         current_user: Current authenticated user (from JWT token)
     
     Returns:
-        UserResponse with current user information
+        UserResponse with current user information, with an ETag (or an
+        empty 304 if the client's copy is still current)
     """
-    return UserResponse(
+    user_info = UserResponse.model_construct(
         id=current_user.id,
         email=current_user.email,
         full_name=current_user.full_name,
         created_at=current_user.created_at,
         is_active=current_user.is_active
     )
+    return etag_json_response(request, user_info)
@@ -5,25 +5,140 @@ This module contains all notes-related endpoints including
 CRUD operations for notes with proper authentication.
 """
 
-from typing import List, Optional # this is optional as in latest python versions we dont need to import
-from fastapi import APIRouter, HTTPException, status, Depends, Query # again we are importing the functions necessary from fastapi module
+import asyncio
+from functools import partial
+from typing import AsyncIterator, List, Optional, Union # this is optional as in latest python versions we dont need to import
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request # again we are importing the functions necessary from fastapi module
+from fastapi.responses import Response, StreamingResponse
+from pydantic import TypeAdapter
+from bson import ObjectId
+from bson.errors import InvalidId
 from schemas import (
-    NoteCreate, NoteUpdate, NoteResponse, NotesListResponse,
+    NoteCreate, NotesBulkCreate, NoteUpdate, NoteResponse, NoteListItem, NotesListResponse,
+    NotesSummaryListResponse,
     MessageResponse, ErrorResponse, UserInDB
 )
-from auth import get_current_active_user
+from auth import get_current_user
+from utils import (
+    to_object_id, etag_json_response, gather_or_cancel, model_json_response,
+    not_modified_response, version_etag
+)
 from crud import (
-    create_note, get_user_notes, get_note_by_id, 
+    create_note, create_notes_bulk, get_user_notes, get_note_by_id, get_note_version,
     update_note, delete_note, get_user_notes_count,
-    search_user_notes
+    search_user_notes, count_search_user_notes, iter_user_notes, NoteListFields,
+    get_cached_first_page, cache_first_page, first_page_cache_version, notes_generation
 )
 
+# built once, used to serialize the bulk create response in one go
+note_list_adapter = TypeAdapter(List[NoteResponse])
+
 router = APIRouter() # same as before its a way to define your routes which enables grouping similar routes 
 
 
+async def valid_oid(note_id: str) -> ObjectId:
+    """
+    Parse the note_id path parameter into an ObjectId
+    
+    Malformed ids are rejected with a 400 right here, without a database call.
+    Declared async even though it never awaits: FastAPI runs plain `def`
+    dependencies in its thread pool, and that hop costs far more than parsing.
+    
+    Args:
+        note_id: Note id from the URL path
+    
+    Returns:
+        Parsed ObjectId
+    
+    Raises:
+        HTTPException: If note_id is not a valid ObjectId
+    """
+    try:
+        return to_object_id(note_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid note ID format"
+        )
+
+
+def page_number(skip: int, limit: int) -> int:
+    """
+    1-based page number of a skip/limit window (used by every list response)
+    """
+    return (skip // limit) + 1
+
+
+async def next_note(notes: AsyncIterator[NoteListItem]) -> Optional[NoteListItem]:
+    """
+    Next note from a note stream, or None once it is exhausted
+    """
+    try:
+        return await notes.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def stream_notes_page(
+    user_id: ObjectId,
+    notes: AsyncIterator[NoteListItem],
+    first_note: Optional[NoteListItem],
+    skip: int,
+    limit: int,
+    include_total: bool
+):
+    """
+    Write a NotesListResponse with full note content piece by piece
+    
+    Each note is serialized and sent as soon as it comes off the cursor, so
+    only one batch of notes is held in memory rather than the whole page.
+    One extra note is read (and not sent) to tell whether there's a next page.
+    If asked for, the count runs concurrently; the metadata goes after the
+    notes array.
+    
+    Args:
+        user_id: Owner of the notes
+        notes: Stream of the page's notes (limit + 1 of them at most)
+        first_note: First note of the stream, already read by the caller
+            (None if the page is empty)
+        skip: Number of notes to skip
+        limit: Maximum number of notes to return
+        include_total: Whether to count all of the user's notes
+    
+    Yields:
+        Chunks of the JSON response body
+    """
+    count_task = asyncio.ensure_future(get_user_notes_count(user_id)) if include_total else None
+    try:
+        yield b'{"notes":['
+        separator = b""
+        sent = 0
+        has_more = False
+        note = first_note
+        while note is not None:
+            if sent == limit:
+                # the extra note (always the last one) just tells us there is a next page
+                has_more = True
+            else:
+                yield separator + note.model_dump_json(by_alias=True, exclude_none=True).encode()
+                separator = b","
+                sent += 1
+            note = await next_note(notes)
+        
+        metadata = f'"has_more":{"true" if has_more else "false"},"page":{page_number(skip, limit)},"per_page":{limit}'
+        if count_task is not None:
+            metadata += f',"total":{await count_task}'
+        yield f"],{metadata}}}".encode()
+    finally:
+        # client went away mid-stream, no point finishing the count (or reading the cursor)
+        if count_task is not None:
+            count_task.cancel()
+        await notes.aclose()
+
+
 @router.get(
     "/", # this is the main one and opening info we get frm the main page
-    response_model=NotesListResponse,
+    response_model=Union[NotesListResponse, NotesSummaryListResponse], # summary one is for fields=summary
     responses={
         401: {"model": ErrorResponse, "description": "Not authenticated"}
     }
@@ -36,7 +151,13 @@ async def get_notes( #the skip basically tells us the number of notes that preex
     limit: int = Query(50, ge=1, le=100, description="Maximum number of notes to return"),
     #this is bascially to check if the link has some keyword in it and if yes search for that 
     search: Optional[str] = Query(None, description="Search query for notes"),
-    current_user: UserInDB = Depends(get_current_active_user) #this basically ensures with the help of 
+    #by default we only send a short preview of the content, the client can ask for the whole thing
+    #or for no content at all (summary is just title, tags, favorite, updated_at and version)
+    fields: NoteListFields = Query("preview", description="'preview' for a content snippet, 'full' for the whole content, 'summary' for no content"),
+    #counting every note costs an extra query so we only do it when someone actually asks for it,
+    #has_more is enough to know if there is a next page
+    include_total: bool = Query(False, description="Also count all matching notes (adds a count query)"),
+    current_user: UserInDB = Depends(get_current_user) #this basically ensures with the help of 
     #the jwt token that whose account this is and whose info to show to
 ):
     """
@@ -49,28 +170,78 @@ async def get_notes( #the skip basically tells us the number of notes that preex
         skip: Number of notes to skip (for pagination)
         limit: Maximum number of notes to return
         search: Optional search query to filter notes
+        fields: Whether to return a content preview, the full content or a summary without content
+        include_total: Whether to also return the total number of matching notes
         current_user: Current authenticated user
     
     Returns:
-        NotesListResponse with notes list and metadata
+        NotesListResponse with notes list and metadata (streamed when the
+        full content is requested), or NotesSummaryListResponse for summaries
     """
-    user_id = str(current_user.id)
+    user_id = current_user.id
     
     # Get notes based on search query
+    if not search and fields == "full":
+        # full notes can make for a big page so we stream it instead of building it all in memory,
+        # preview pages are small so they stay as a normal (cacheable) response
+        notes = iter_user_notes(user_id, skip, limit + 1, "full")
+        # the first batch is read before the 200 and the first bytes go out, so a db error here
+        # still ends up as a proper 500 from the handler in main.py
+        first_note = await next_note(notes)
+        return StreamingResponse(
+            stream_notes_page(user_id, notes, first_note, skip, limit, include_total),
+            media_type="application/json"
+        )
+    
+    # the plain first page is what every dashboard load asks for, so its response is
+    # kept for a few seconds and served as is (any write to the user's notes drops it).
+    # the version makes writes handled by other workers count too
+    first_page_params = None
+    if skip == 0 and not search:
+        version = await first_page_cache_version(user_id)
+        if version is not None:
+            first_page_params = (version, limit, fields, include_total)
+    if first_page_params is not None:
+        cached_body = get_cached_first_page(user_id, first_page_params)
+        if cached_body is not None:
+            return Response(content=cached_body, media_type="application/json")
+        # taken before reading, so a write that lands while we read keeps us from caching a stale page
+        first_page_generation = notes_generation(user_id)
+    
+    # we ask for one more note than the page size, if it comes back there is a next page
     if search:
-        notes = await search_user_notes(user_id, search, skip, limit)
-        # For search, we don't provide total count to avoid expensive operations
-        total = len(notes)
+        fetch_rows = search_user_notes(user_id, search, skip, limit + 1, fields)
+        count_notes = partial(count_search_user_notes, user_id, search)
+    else:
+        fetch_rows = get_user_notes(user_id, skip, limit + 1, fields)
+        count_notes = partial(get_user_notes_count, user_id)
+    
+    if include_total:
+        # the page and the count are independent reads so we run them together
+        # (if one of them fails the other one gets cancelled instead of running for nothing)
+        rows, total = await gather_or_cancel(fetch_rows, count_notes())
     else:
-        notes = await get_user_notes(user_id, skip, limit)
-        total = await get_user_notes_count(user_id)
-    
-    return NotesListResponse(
-        notes=notes,
-        total=total,
-        page=(skip // limit) + 1,
-        per_page=limit
+        rows, total = await fetch_rows, None
+    
+    # the notes come straight from our own db layer so we skip validating them again
+    # (model_construct) and serialize ourselves instead of going through response_model,
+    # dropping None fields so preview lists dont carry "content": null for every note
+    list_response_model = NotesSummaryListResponse if fields == "summary" else NotesListResponse
+    response = model_json_response(
+        list_response_model.model_construct(
+            notes=rows[:limit],
+            total=total,
+            has_more=len(rows) > limit,
+            page=page_number(skip, limit),
+            per_page=limit
+        ),
+        exclude_none=True
     )
+    
+    if first_page_params is not None:
+        cache_first_page(user_id, first_page_params, response.body, first_page_generation)
+    
+    return response
 
 
 @router.post(
@@ -84,7 +255,7 @@ async def get_notes( #the skip basically tells us the number of notes that preex
 )
 async def create_new_note(
     note_data: NoteCreate,
-    current_user: UserInDB = Depends(get_current_active_user)
+    current_user: UserInDB = Depends(get_current_user)
 ):
     """
     Create a new note
@@ -98,16 +269,50 @@ async def create_new_note(
     Returns:
         NoteResponse for the created note
     """
-    try:
+    #this is basically to create a new note if no error then we just return the new note
+    #db errors are turned into a 500 by the handler registered in main.py
+    note = await create_note(note_data, current_user.id)
+    #serialized straight to json bytes by pydantic (datetimes and ids included) so fastapi doesnt
+    #validate it again and build an intermediate dict for orjson
+    return model_json_response(note, status_code=status.HTTP_201_CREATED)
 
-        #this is basically to create a new note if no error then we just return the new note 
-        note = await create_note(note_data, str(current_user.id))
-        return note
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to create note"
-        )
+
+#this is for importing a bunch of notes at once, instead of calling POST / again and again
+#all of them go to the db in one insert
+@router.post(
+    "/bulk",
+    response_model=List[NoteResponse],
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        401: {"model": ErrorResponse, "description": "Not authenticated"},
+        422: {"model": ErrorResponse, "description": "Validation error"}
+    }
+)
+async def create_new_notes_bulk(
+    payload: NotesBulkCreate,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Create many notes at once
+    
+    Creates all given notes for the authenticated user with a single
+    database round trip.
+    
+    Args:
+        payload: Notes to create (at most 500)
+        current_user: Current authenticated user
+    
+    Returns:
+        List of NoteResponse for the created notes, in request order
+    """
+    notes = await create_notes_bulk(payload.notes, current_user.id)
+    #up to 500 notes, so like the single create we serialize them ourselves instead of letting
+    #fastapi validate every one of them again through response_model
+    return Response(
+        content=note_list_adapter.dump_json(notes, by_alias=True),
+        status_code=status.HTTP_201_CREATED,
+        media_type="application/json"
+    )
 
 #here we are basically searching for a given note id and searching if that exists if it does 
 # we provide it with the schema of note response
@@ -123,8 +328,9 @@ async def create_new_note(
 
 #
 async def get_note(
-    note_id: str,
-    current_user: UserInDB = Depends(get_current_active_user)
+    request: Request,
+    note_id: ObjectId = Depends(valid_oid),
+    current_user: UserInDB = Depends(get_current_user)
 ):
     """
     Get a specific note by ID
@@ -132,27 +338,41 @@ async def get_note(
     Retrieves a specific note belonging to the authenticated user.
     
     Args:
+        request: Incoming request (for If-None-Match)
         note_id: ID of the note to retrieve
         current_user: Current authenticated user
     
     Returns:
-        NoteResponse for the requested note
+        NoteResponse for the requested note, with a W/"<version>" ETag (or
+        an empty 304 if the client's copy is still current)
     
     Raises:
         HTTPException: If note not found or invalid ID
     """
 
+    not_found = HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Note not found"
+    )
+
+    #the etag is the note version (every update bumps it), so when the client sends If-None-Match
+    #we first ask the db for just the version and answer 304 without loading the note at all
+    if request.headers.get("if-none-match"):
+        version = await get_note_version(note_id, current_user.id)
+        if version is None:
+            raise not_found
+        not_modified = not_modified_response(request, version_etag(version))
+        if not_modified is not None:
+            return not_modified
+
     #again mainly here we are trying to just check if the user is authenticated and whether he shud be 
     #allowed to access
-    note = await get_note_by_id(note_id, str(current_user.id))
+    note = await get_note_by_id(note_id, current_user.id)
     
     if not note:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Note not found"
-        )
+        raise not_found
     
-    return note
+    return etag_json_response(request, note, etag=version_etag(note.version))
 
 #this is basically to update a node first we check if any error issue comes in
 
@@ -167,9 +387,9 @@ async def get_note(
     }
 )
 async def update_existing_note(
-    note_id: str,
     note_update: NoteUpdate,
-    current_user: UserInDB = Depends(get_current_active_user)
+    note_id: ObjectId = Depends(valid_oid),
+    current_user: UserInDB = Depends(get_current_user)
 
     #this step is still a check if its an existing user
 ):
@@ -190,16 +410,9 @@ async def update_existing_note(
     Raises:
         HTTPException: If note not found, invalid ID, or version conflict
     """
-    try:
-        updated_note = await update_note(note_id, str(current_user.id), note_update)
-        return updated_note
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to update note"
-        )
+    #404 and 409 come out of update_note as HTTPExceptions, db errors go to the global handler
+    updated_note = await update_note(note_id, current_user.id, note_update)
+    return model_json_response(updated_note) # same as create, no second validation pass
 
 
 @router.delete(
@@ -212,13 +425,15 @@ async def update_existing_note(
     }
 )
 async def delete_existing_note(
-    note_id: str,
-    current_user: UserInDB = Depends(get_current_active_user)
+    note_id: ObjectId = Depends(valid_oid),
+    current_user: UserInDB = Depends(get_current_user)
 ):
     """
     Delete a note
     
-    Permanently deletes a note belonging to the authenticated user.
+    Deletes a note belonging to the authenticated user. The note is only
+    flagged as deleted (and purged by the database later); it disappears
+    from every read right away.
     
     Args:
         note_id: ID of the note to delete
@@ -230,21 +445,12 @@ async def delete_existing_note(
     Raises:
         HTTPException: If note not found or invalid ID
     """
-    try:
-        deleted = await delete_note(note_id, str(current_user.id))
-        
-        if not deleted:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Note not found"
-            )
-        
-        return MessageResponse(message="Note deleted successfully")
-        
-    except HTTPException:
-        raise
-    except Exception as e:
+    deleted = await delete_note(note_id, current_user.id)
+    
+    if not deleted:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to delete note"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note not found"
         )
+    
+    return MessageResponse(message="Note deleted successfully")
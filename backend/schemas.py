@@ -5,29 +5,49 @@ This module contains all Pydantic models used for request validation,
 response serialization, and data transfer objects (DTOs).
 """
 
+from functools import cached_property
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
+from pydantic_core import core_schema
 from typing import Optional, List
 from datetime import datetime
 from bson import ObjectId
+from bson.errors import InvalidId
 
 
 class PyObjectId(ObjectId):
     """
     Custom ObjectId type for Pydantic models
+    
+    Accepts ObjectId instances or 24-character hex strings and is emitted
+    as a plain hex string in JSON. Validation and serialization are part of
+    the model's core schema, so no per-field Python fallback is involved.
     """
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                str, when_used="json"
+            )
+        )
 
     @classmethod
     def validate(cls, v):
-        if not ObjectId.is_valid(v):
+        # Already parsed (e.g. read from MongoDB): nothing to do
+        if isinstance(v, ObjectId):
+            return v
+        # ObjectId(None) would silently generate a brand new id
+        if v is None:
+            raise ValueError("Invalid objectid")
+        # Parse once; is_valid() + ObjectId() would parse the hex twice
+        try:
+            return ObjectId(v)
+        except (InvalidId, TypeError):
             raise ValueError("Invalid objectid")
-        return ObjectId(v)
 
     @classmethod
-    def __get_pydantic_json_schema__(cls, field_schema):
-        field_schema.update(type="string")
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "string"}
 
 
 # User Schemas
@@ -55,7 +75,7 @@ class UserResponse(BaseModel):
     model_config = ConfigDict(
         populate_by_name=True,
         arbitrary_types_allowed=True,
-        json_encoders={ObjectId: str}
+        frozen=True
     )
     
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
@@ -69,7 +89,22 @@ class UserInDB(UserResponse):
     """
     Schema for user data as stored in database (includes hashed password)
     """
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True,
+        frozen=True,
+        ignored_types=(cached_property,)
+    )
+    
     hashed_password: str
+    
+    @cached_property
+    def id_str(self) -> str:
+        """
+        Hex string form of the user id, computed once per user object
+        (which the auth user cache keeps around between requests)
+        """
+        return str(self.id)
 
 
 # Authentication Schemas
@@ -101,6 +136,13 @@ class NoteCreate(BaseModel):
     is_favorite: bool = Field(default=False, description="Whether note is marked as favorite")
 
 
+class NotesBulkCreate(BaseModel):
+    """
+    Schema for creating many notes in one request
+    """
+    notes: List[NoteCreate] = Field(..., max_length=500, description="Notes to create (at most 500)")
+
+
 class NoteUpdate(BaseModel):
     """
     Schema for updating an existing note
@@ -119,7 +161,7 @@ class NoteResponse(BaseModel):
     model_config = ConfigDict(
         populate_by_name=True,
         arbitrary_types_allowed=True,
-        json_encoders={ObjectId: str}
+        frozen=True
     )
     
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
@@ -133,11 +175,53 @@ class NoteResponse(BaseModel):
     version: int = Field(default=1, description="Version number for optimistic concurrency control")
 
 
+class NoteListItem(BaseModel):
+    """
+    Schema for notes in list responses (full content replaced by a short preview
+    unless the client asks for full notes)
+    """
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True,
+        frozen=True
+    )
+    
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    title: str
+    content_preview: Optional[str] = Field(default=None, description="First characters of the note content (not with fields=full)")
+    content: Optional[str] = Field(default=None, description="Full note content (only with fields=full)")
+    tags: List[str] = Field(default_factory=list)
+    is_favorite: bool = False
+    user_id: PyObjectId
+    created_at: datetime
+    updated_at: datetime
+    version: int = Field(default=1, description="Version number for optimistic concurrency control")
+
+
+class NoteSummaryResponse(BaseModel):
+    """
+    Schema for notes in summary list responses (no content at all)
+    """
+    model_config = ConfigDict(
+        populate_by_name=True,
+        arbitrary_types_allowed=True,
+        frozen=True
+    )
+    
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    title: str
+    tags: List[str] = Field(default_factory=list)
+    is_favorite: bool = False
+    updated_at: datetime
+    version: int = Field(default=1, description="Version number for optimistic concurrency control")
+
+
 class NoteInDB(NoteResponse):
     """
-    Schema for note data as stored in database
+    Schema for note data as stored in database (deleting a note only flags it)
     """
-    pass
+    is_deleted: bool = False
+    deleted_at: Optional[datetime] = None
 
 
 # Response Schemas
@@ -160,8 +244,20 @@ class NotesListResponse(BaseModel):
     """
     Schema for notes list response with metadata
     """
-    notes: List[NoteResponse]
-    total: int
+    notes: List[NoteListItem]
+    total: Optional[int] = Field(default=None, description="Total matching notes (only with include_total=true)")
+    has_more: bool = Field(default=False, description="Whether another page follows this one")
+    page: int = 1
+    per_page: int = 50
+
+
+class NotesSummaryListResponse(BaseModel):
+    """
+    Schema for notes summary list response (fields=summary) with metadata
+    """
+    notes: List[NoteSummaryResponse]
+    total: Optional[int] = Field(default=None, description="Total matching notes (only with include_total=true)")
+    has_more: bool = Field(default=False, description="Whether another page follows this one")
     page: int = 1
     per_page: int = 50
 
@@ -0,0 +1,236 @@
+"""
+Shared Helpers
+
+This module contains small utilities shared by the authentication,
+CRUD and router modules.
+"""
+
+import asyncio
+import hashlib
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from bson import ObjectId
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+@lru_cache(maxsize=10000)
+def to_object_id(value: str) -> ObjectId:
+    """
+    Convert a hex string into an ObjectId, memoizing the result
+    
+    The same ids (the authenticated user's id, the note being edited) are
+    parsed again and again across requests, so repeat conversions become
+    a dictionary lookup instead of a fresh hex parse. ObjectIds are
+    immutable, which makes sharing the cached instance safe.
+    
+    Args:
+        value: 24-character hex string
+    
+    Returns:
+        Parsed ObjectId
+    
+    Raises:
+        bson.errors.InvalidId: If the value is not a valid ObjectId
+    """
+    return ObjectId(value)
+
+
+def utc_now() -> datetime:
+    """
+    Current UTC time at BSON date precision (milliseconds)
+    
+    Derived from a single `time.time_ns()` read. Timestamps are truncated to
+    the millisecond because that is all a BSON date stores, so a value
+    returned right after a write is identical to the one read back later.
+    (Whole milliseconds survive the float division exactly: the result is
+    rounded to microseconds.)
+    
+    Returns:
+        Naive datetime in UTC, like the ones Motor returns for BSON dates
+    """
+    return datetime.utcfromtimestamp(time.time_ns() // 1_000_000 / 1000)
+
+
+# In-flight calls started through singleflight(), keyed by the caller's key
+_inflight: Dict[Hashable, asyncio.Future] = {}
+
+
+async def singleflight(key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run `func()` once for all concurrent callers sharing the same key
+    
+    The first caller starts the call; everyone else arriving while it is in
+    flight awaits the same result (or exception) instead of issuing an
+    identical query. The call is shielded, so one caller being cancelled
+    doesn't cancel it for the others.
+    
+    Args:
+        key: Identifies identical calls (e.g. ("notes_count", user_id))
+        func: Zero-argument coroutine function doing the actual work
+    
+    Returns:
+        Whatever `func()` returns
+    """
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(func())
+        _inflight[key] = future
+        
+        def _release(done: asyncio.Future) -> None:
+            # Only drop our own entry; singleflight_forget() may have replaced it
+            if _inflight.get(key) is done:
+                del _inflight[key]
+        
+        future.add_done_callback(_release)
+    return await asyncio.shield(future)
+
+
+def singleflight_forget(key: Hashable) -> None:
+    """
+    Stop handing out the in-flight call for a key
+    
+    Callers already waiting still get its result, but the next caller starts
+    a fresh call. Use after a write that makes the in-flight result stale.
+    
+    Args:
+        key: Key previously passed to singleflight()
+    """
+    _inflight.pop(key, None)
+
+
+async def gather_or_cancel(*aws: Awaitable[Any]) -> list:
+    """
+    Run awaitables concurrently; if one fails, cancel the rest
+    
+    Like `asyncio.gather`, results come back in argument order and the
+    first exception propagates. Unlike plain gather, the sibling tasks are
+    cancelled instead of being left running (and holding a connection) for
+    a response that will never be sent.
+    
+    Args:
+        *aws: Coroutines / awaitables to run
+    
+    Returns:
+        List of results, in argument order
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+def model_json_response(model: BaseModel, status_code: int = 200, exclude_none: bool = False) -> Response:
+    """
+    Serialize a response model straight into a JSON response
+    
+    Returning a Response makes FastAPI skip its response_model pass, which
+    would otherwise dump the (already trusted) model to a dict, validate it
+    again and then encode it. The route's response_model still documents
+    the shape in OpenAPI.
+    
+    Args:
+        model: Response model to serialize (by alias, like FastAPI does)
+        status_code: HTTP status code
+        exclude_none: Leave out fields that are None
+    
+    Returns:
+        JSON response
+    """
+    return Response(
+        content=model.model_dump_json(by_alias=True, exclude_none=exclude_none),
+        status_code=status_code,
+        media_type="application/json"
+    )
+
+
+# Cache policy for per-user resources served with an ETag: only the user's own
+# browser may store them ("private"), and it must revalidate on every use
+# ("no-cache"), so an edit is never hidden behind a stale copy. Revalidation
+# of unchanged data is answered with a bodiless 304.
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Check an If-None-Match header (which may list several tags) against an ETag
+    """
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: a W/ prefix on either side doesn't matter for GETs
+    def strip_weak(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+    
+    bare_etag = strip_weak(etag)
+    return any(strip_weak(candidate) == bare_etag for candidate in if_none_match.split(","))
+
+
+def version_etag(version: int) -> str:
+    """
+    Weak ETag for a document that carries a version counter
+    
+    Every write bumps the version, so it identifies the representation
+    without hashing the body (weak: it says nothing about byte equality).
+    """
+    return f'W/"{version}"'
+
+
+def not_modified_response(
+    request: Request,
+    etag: str,
+    cache_control: str = PRIVATE_REVALIDATE
+) -> Optional[Response]:
+    """
+    Empty 304 response if the client's If-None-Match matches the ETag
+    
+    Args:
+        request: Incoming request (for its If-None-Match header)
+        etag: Current ETag of the resource
+        cache_control: Cache-Control header value
+    
+    Returns:
+        304 response, or None if the client's copy is stale (or it sent none)
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+    return None
+
+
+def etag_json_response(
+    request: Request,
+    model: BaseModel,
+    cache_control: str = PRIVATE_REVALIDATE,
+    etag: Optional[str] = None
+) -> Response:
+    """
+    Serialize a response model to JSON and tag it with an ETag
+    
+    Unless an ETag is given, it is a 128-bit BLAKE2b digest of the serialized
+    body. If the client already holds that exact representation
+    (If-None-Match), a 304 without a body is returned instead.
+    
+    Args:
+        request: Incoming request (for its If-None-Match header)
+        model: Response model to serialize (by alias, like FastAPI does)
+        cache_control: Cache-Control header value
+        etag: Precomputed ETag (e.g. from `version_etag`), skips hashing
+    
+    Returns:
+        200 JSON response with ETag, or an empty 304 response
+    """
+    body = model.model_dump_json(by_alias=True).encode()
+    if etag is None:
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    
+    not_modified = not_modified_response(request, etag, cache_control)
+    if not_modified is not None:
+        return not_modified
+    
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -15,7 +15,7 @@ export default function NoteCard({ note, onDelete, onToggleFavorite }) {
     })
   }
 
-  const truncateContent = (content, maxLength = 150) => {
+  const truncateContent = (content = '', maxLength = 150) => {
     if (content.length <= maxLength) return content
     return content.substring(0, maxLength) + '...'
   }
@@ -65,7 +65,8 @@ export default function NoteCard({ note, onDelete, onToggleFavorite }) {
       {/* Note content */}
       <div className="mb-4">
         <p className="text-gray-700 leading-relaxed">
-          {truncateContent(note.content)}
+          {/* List responses only carry a preview; a freshly updated note has full content */}
+          {truncateContent(note.content_preview ?? note.content)}
         </p>
       </div>
 